@@ -7,40 +7,51 @@ Uses mmdebstrap for rootfs creation and creates bootable disk images.
 """
 
 import os
+import re
 import sys
 import subprocess
-import shutil
 import json
+import shlex
 from pathlib import Path
+from datetime import datetime, timezone
 from typing import Optional
-
-import toml
-from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor
+
+from fry_build_common import (
+    CACHE_DIR,
+    PROFILES_DIR,
+    load_config,
+    load_profile_config,
+    get_architecture,
+    get_sources_list,
+    get_include_options,
+    get_parallel_unpack_env,
+    get_apt_proxy_options,
+    get_proxied_mirror,
+    get_apt_cache_options,
+    get_rootfs_cache_path,
+    restore_rootfs_cache,
+    save_rootfs_cache,
+    discard_rootfs,
+)
 
 # Project paths
 PROJECT_ROOT = Path(__file__).parent.parent
-BASE_CONFIG_PATH = PROJECT_ROOT / "base-config.toml"
-PROFILES_DIR = PROJECT_ROOT / "profiles"
 RESOURCES_DIR = PROJECT_ROOT / "resources"
 WORK_DIR = PROJECT_ROOT / "work"
 OUTPUT_DIR = PROJECT_ROOT / "output"
-CACHE_DIR = PROJECT_ROOT / "cache"
-
-
-def load_config():
-    """Load base configuration."""
-    with open(BASE_CONFIG_PATH) as f:
-        return toml.load(f)
 
 
-def load_profile_config(profile_name: str):
-    """Load profile-specific configuration."""
-    profile_path = PROFILES_DIR / profile_name / "profile-config.toml"
-    if not profile_path.exists():
-        print(f"Error: Profile '{profile_name}' not found at {profile_path}")
-        sys.exit(1)
-    with open(profile_path) as f:
-        return toml.load(f)
+def write_file(path: Path, content: str):
+    """Write a small text file with a single write() call, creating parent directories."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = content.encode()
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        while data:
+            data = data[os.write(fd, data):]
+    finally:
+        os.close(fd)
 
 
 def ensure_directories():
@@ -49,22 +60,6 @@ def ensure_directories():
         directory.mkdir(parents=True, exist_ok=True)
 
 
-def get_architecture(profile_config: dict) -> str:
-    """Get Debian architecture from profile config."""
-    arch_mapping = {
-        "x86_64": "amd64",
-        "amd64": "amd64",
-        "arm64": "arm64",
-        "aarch64": "arm64",
-        "armhf": "armhf",
-        "arm": "armhf",
-        "mipsel": "mipsel",
-        "mips": "mips",
-    }
-    arch = profile_config.get("build", {}).get("architecture", "amd64")
-    return arch_mapping.get(arch, arch)
-
-
 def get_kernel_package(arch: str, profile_config: dict) -> str:
     """Get the appropriate kernel package for the architecture."""
     # Check if profile specifies a kernel
@@ -106,37 +101,17 @@ def build_package_list(base_config: dict, profile_config: dict, arch: str) -> li
         packages.extend(base_config.get("packages", {}).get("server", []))
 
     # Remove excluded packages
-    exclude = profile_config.get("packages", {}).get("exclude", [])
+    exclude = set(profile_config.get("packages", {}).get("exclude", []))
     packages = [p for p in packages if p not in exclude]
 
     # Remove duplicates while preserving order
-    seen = set()
-    unique_packages = []
-    for p in packages:
-        if p not in seen:
-            seen.add(p)
-            unique_packages.append(p)
-
-    return unique_packages
+    return list(dict.fromkeys(packages))
 
 
 def create_apt_sources(base_config: dict, rootfs_path: Path):
     """Create APT sources.list for Debian Trixie."""
-    suite = base_config.get("debian", {}).get("suite", "trixie")
-    mirror = base_config.get("debian", {}).get("mirror", "https://deb.debian.org/debian")
-    security_mirror = base_config.get("debian", {}).get("security_mirror", "https://deb.debian.org/debian-security")
-    components = base_config.get("debian", {}).get("components", ["main", "contrib", "non-free", "non-free-firmware"])
-    components_str = " ".join(components)
-
-    sources_content = f"""# Fry IoT - Debian {suite} sources
-deb {mirror} {suite} {components_str}
-deb {mirror} {suite}-updates {components_str}
-deb {security_mirror} {suite}-security {components_str}
-"""
-
     sources_path = rootfs_path / "etc" / "apt" / "sources.list"
-    sources_path.parent.mkdir(parents=True, exist_ok=True)
-    sources_path.write_text(sources_content)
+    write_file(sources_path, get_sources_list(base_config))
 
 
 def create_fry_apt_sources(rootfs_path: Path):
@@ -145,48 +120,59 @@ def create_fry_apt_sources(rootfs_path: Path):
 deb [signed-by=/usr/share/keyrings/fry-archive-keyring.gpg] https://apt.fry.network/debian trixie main
 """
     sources_path = rootfs_path / "etc" / "apt" / "sources.list.d" / "fry.list"
-    sources_path.parent.mkdir(parents=True, exist_ok=True)
-    sources_path.write_text(fry_sources)
+    write_file(sources_path, fry_sources)
 
 
-def build_rootfs(base_config: dict, profile_config: dict, profile_name: str) -> Path:
+def build_rootfs(base_config: dict, profile_config: dict, profile_name: str, arch: str,
+                 apt_proxy: Optional[str] = None) -> Path:
     """Build the Debian rootfs using mmdebstrap."""
     print(f"\n=== Building rootfs for {profile_name} ===")
 
-    arch = get_architecture(profile_config)
     suite = base_config.get("debian", {}).get("suite", "trixie")
     mirror = base_config.get("debian", {}).get("mirror", "https://deb.debian.org/debian")
+    components = base_config.get("debian", {}).get("components", ["main", "contrib", "non-free", "non-free-firmware"])
 
     rootfs_path = WORK_DIR / "rootfs"
 
     # Clean previous rootfs
     if rootfs_path.exists():
         print("Cleaning previous rootfs...")
-        subprocess.run(["sudo", "rm", "-rf", str(rootfs_path)], check=True)
+        discard_rootfs(rootfs_path)
 
     rootfs_path.mkdir(parents=True, exist_ok=True)
 
     # Build package list
     packages = build_package_list(base_config, profile_config, arch)
+
+    # Reuse a cached rootfs if the inputs are unchanged
+    cache_path = get_rootfs_cache_path(arch, suite, mirror, components, packages, apt_proxy)
+    if cache_path.exists():
+        print(f"Restoring cached rootfs: {cache_path.name}")
+        restore_rootfs_cache(cache_path, rootfs_path)
+        return rootfs_path
+
     print(f"Installing {len(packages)} packages...")
 
     # Build mmdebstrap command
     cmd = [
-        "sudo", "mmdebstrap",
+        "sudo", "env", *get_parallel_unpack_env(), "mmdebstrap",
         "--arch", arch,
         "--variant=minbase",
-        "--include=" + ",".join(packages),
-        "--components=main,contrib,non-free,non-free-firmware",
+        *get_include_options(packages),
+        "--components=" + ",".join(components),
     ]
 
     # Add QEMU for cross-architecture builds
     if arch != "amd64":
         cmd.append("--architectures=" + arch)
 
-    # Use cache if available
-    cache_path = CACHE_DIR / f"apt-cache-{arch}"
-    if cache_path.exists():
-        cmd.append(f"--aptopt=Dir::Cache::archives \"{cache_path}\"")
+    # Route downloads through a caching proxy (e.g. apt-cacher-ng) if configured
+    if apt_proxy:
+        cmd.extend(get_apt_proxy_options(apt_proxy))
+        mirror = get_proxied_mirror(mirror)
+
+    # Keep downloaded packages between builds
+    cmd.extend(get_apt_cache_options(CACHE_DIR / f"apt-cache-{arch}"))
 
     cmd.extend([suite, str(rootfs_path), mirror])
 
@@ -197,13 +183,14 @@ def build_rootfs(base_config: dict, profile_config: dict, profile_name: str) ->
         print(f"Error building rootfs: {e}")
         sys.exit(1)
 
+    print(f"Caching rootfs: {cache_path.name}")
+    save_rootfs_cache(rootfs_path, cache_path)
+
     return rootfs_path
 
 
-def configure_rootfs(base_config: dict, profile_config: dict, profile_name: str, rootfs_path: Path):
+def configure_rootfs(base_config: dict, profile_config: dict, profile_name: str, arch: str, rootfs_path: Path):
     """Configure the rootfs with system settings."""
-    print("\n=== Configuring rootfs ===")
-
     os_name = base_config.get("general", {}).get("os_name", "fry-iot")
     os_version = base_config.get("general", {}).get("os_version", "1.0.0")
     codename = profile_config.get("general", {}).get("codename", profile_name)
@@ -211,7 +198,7 @@ def configure_rootfs(base_config: dict, profile_config: dict, profile_name: str,
     # Set hostname
     hostname = profile_config.get("system", {}).get("hostname", f"fry-{codename.lower()}")
     hostname_path = rootfs_path / "etc" / "hostname"
-    hostname_path.write_text(f"{hostname}\n")
+    write_file(hostname_path, f"{hostname}\n")
 
     # Configure hosts
     hosts_path = rootfs_path / "etc" / "hosts"
@@ -223,7 +210,7 @@ def configure_rootfs(base_config: dict, profile_config: dict, profile_name: str,
 ff02::1     ip6-allnodes
 ff02::2     ip6-allrouters
 """
-    hosts_path.write_text(hosts_content)
+    write_file(hosts_path, hosts_content)
 
     # Create os-release
     os_release_path = rootfs_path / "etc" / "os-release"
@@ -238,11 +225,13 @@ HOME_URL="https://fry.network/"
 SUPPORT_URL="https://github.com/Fry-Foundation/fry-iot/issues"
 BUG_REPORT_URL="https://github.com/Fry-Foundation/fry-iot/issues"
 """
-    os_release_path.write_text(os_release_content)
+    write_file(os_release_path, os_release_content)
+
+    # Replace the mmdebstrap sources (which may point at the APT proxy)
+    create_apt_sources(base_config, rootfs_path)
 
-    # Create Fry IoT info directory
+    # Fry IoT info directory
     fry_dir = rootfs_path / "etc" / "fry-iot"
-    fry_dir.mkdir(parents=True, exist_ok=True)
 
     # Device info
     device_info = {
@@ -250,11 +239,11 @@ BUG_REPORT_URL="https://github.com/Fry-Foundation/fry-iot/issues"
         "brand": profile_config.get("general", {}).get("brand", "Fry"),
         "model": profile_config.get("general", {}).get("model", codename),
         "version": os_version,
-        "architecture": get_architecture(profile_config),
-        "build_date": subprocess.check_output(["date", "-u", "+%Y-%m-%dT%H:%M:%SZ"]).decode().strip(),
+        "architecture": arch,
+        "build_date": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
     }
     device_info_path = fry_dir / "device.json"
-    device_info_path.write_text(json.dumps(device_info, indent=2))
+    write_file(device_info_path, json.dumps(device_info, indent=2))
 
     # Create banner
     banner_path = rootfs_path / "etc" / "motd"
@@ -275,24 +264,22 @@ BUG_REPORT_URL="https://github.com/Fry-Foundation/fry-iot/issues"
  Documentation: https://docs.fry.network/
 
 """
-    banner_path.write_text(banner_content)
+    write_file(banner_path, banner_content)
 
-    # Copy profile-specific files
+
+def copy_profile_files(profile_name: str, rootfs_path: Path):
+    """Overlay profile-specific files onto the rootfs."""
     profile_files = PROFILES_DIR / profile_name / "files"
     if profile_files.exists():
         print("Copying profile-specific files...")
-        for src_file in profile_files.rglob("*"):
-            if src_file.is_file():
-                rel_path = src_file.relative_to(profile_files)
-                dst_file = rootfs_path / rel_path
-                dst_file.parent.mkdir(parents=True, exist_ok=True)
-                shutil.copy2(src_file, dst_file)
+        subprocess.run([
+            "sudo", "rsync", "-aHAX", "--chown=root:root",
+            f"{profile_files}/", f"{rootfs_path}/"
+        ], check=True)
 
 
 def configure_users(rootfs_path: Path, profile_config: dict):
-    """Configure system users."""
-    print("\n=== Configuring users ===")
-
+    """Write the user setup script run by run_chroot_setup()."""
     # Set root password (default: fryiot)
     root_password = profile_config.get("system", {}).get("root_password", "fryiot")
 
@@ -309,57 +296,35 @@ echo 'fry ALL=(ALL) NOPASSWD:ALL' > /etc/sudoers.d/fry
 chmod 440 /etc/sudoers.d/fry
 """
     script_path = rootfs_path / "tmp" / "setup-users.sh"
-    script_path.parent.mkdir(parents=True, exist_ok=True)
-    script_path.write_text(user_script)
+    write_file(script_path, user_script)
     script_path.chmod(0o755)
 
-    # Run script in chroot
-    subprocess.run([
-        "sudo", "chroot", str(rootfs_path), "/tmp/setup-users.sh"
-    ], check=True)
-
-    # Clean up
-    script_path.unlink()
-
-
-def configure_network(rootfs_path: Path, profile_config: dict):
-    """Configure network settings."""
-    print("\n=== Configuring network ===")
-
-    # Enable NetworkManager
-    services_to_enable = [
-        "NetworkManager",
-        "ssh",
-        "systemd-networkd",
-        "systemd-resolved",
-    ]
-
-    for service in services_to_enable:
-        subprocess.run([
-            "sudo", "chroot", str(rootfs_path),
-            "systemctl", "enable", service
-        ], capture_output=True)
 
+def configure_network(rootfs_path: Path, profile_config: dict) -> list:
+    """Configure network settings and return the services to enable."""
     # Create default network configuration
     network_config = rootfs_path / "etc" / "network" / "interfaces.d" / "setup"
-    network_config.parent.mkdir(parents=True, exist_ok=True)
-    network_config.write_text("""# Fry IoT default network configuration
+    write_file(network_config, """# Fry IoT default network configuration
 # Managed by NetworkManager
 
 auto lo
 iface lo inet loopback
 """)
 
+    return [
+        "NetworkManager",
+        "ssh",
+        "systemd-networkd",
+        "systemd-resolved",
+    ]
 
-def configure_fry_services(base_config: dict, rootfs_path: Path):
-    """Configure Fry Networks services."""
-    print("\n=== Configuring Fry Networks services ===")
 
+def configure_fry_services(base_config: dict, rootfs_path: Path) -> list:
+    """Configure Fry Networks services and return the services to enable."""
     fry_config = base_config.get("fry", {})
 
     # Create Fry configuration
     fry_conf_dir = rootfs_path / "etc" / "fry"
-    fry_conf_dir.mkdir(parents=True, exist_ok=True)
 
     fry_config_content = {
         "api_endpoint": fry_config.get("api_endpoint", "https://api.fry.network"),
@@ -368,7 +333,7 @@ def configure_fry_services(base_config: dict, rootfs_path: Path):
     }
 
     config_path = fry_conf_dir / "config.json"
-    config_path.write_text(json.dumps(fry_config_content, indent=2))
+    write_file(config_path, json.dumps(fry_config_content, separators=(",", ":")))
 
     # Create Fry node service
     fry_node_service = """[Unit]
@@ -388,8 +353,7 @@ Group=fry
 WantedBy=multi-user.target
 """
     service_path = rootfs_path / "etc" / "systemd" / "system" / "fry-node.service"
-    service_path.parent.mkdir(parents=True, exist_ok=True)
-    service_path.write_text(fry_node_service)
+    write_file(service_path, fry_node_service)
 
     # Create bandwidth miner service
     bandwidth_miner_service = """[Unit]
@@ -410,7 +374,7 @@ Group=fry
 WantedBy=multi-user.target
 """
     miner_service_path = rootfs_path / "etc" / "systemd" / "system" / "bandwidth-miner.service"
-    miner_service_path.write_text(bandwidth_miner_service)
+    write_file(miner_service_path, bandwidth_miner_service)
 
     # Create first-boot setup script
     first_boot_script = """#!/bin/bash
@@ -448,8 +412,7 @@ systemctl disable fry-first-boot.service
 echo "First boot setup complete!"
 """
     first_boot_path = rootfs_path / "usr" / "local" / "bin" / "fry-first-boot.sh"
-    first_boot_path.parent.mkdir(parents=True, exist_ok=True)
-    first_boot_path.write_text(first_boot_script)
+    write_file(first_boot_path, first_boot_script)
     first_boot_path.chmod(0o755)
 
     # Create first-boot service
@@ -469,27 +432,115 @@ RemainAfterExit=yes
 WantedBy=multi-user.target
 """
     first_boot_service_path = rootfs_path / "etc" / "systemd" / "system" / "fry-first-boot.service"
-    first_boot_service_path.write_text(first_boot_service)
+    write_file(first_boot_service_path, first_boot_service)
 
     # Create state directory
     state_dir = rootfs_path / "var" / "lib" / "fry-iot"
     state_dir.mkdir(parents=True, exist_ok=True)
 
+    return [
+        "fry-node.service",
+        "bandwidth-miner.service",
+        "fry-first-boot.service",
+    ]
+
+
+def run_chroot_setup(rootfs_path: Path, services: list):
+    """Set up users and enable services in the rootfs with a single chroot call."""
+    # Enable each unit on its own so one missing unit does not block the rest
+    enable_cmd = (
+        f"for unit in {shlex.join(services)}; do "
+        'systemctl enable "$unit" || echo "Warning: failed to enable $unit" >&2; '
+        "done"
+    )
+    subprocess.run([
+        "sudo", "chroot", str(rootfs_path), "/bin/bash", "-c",
+        f"/tmp/setup-users.sh && {enable_cmd}"
+    ], check=True)
+
+    # Clean up
+    (rootfs_path / "tmp" / "setup-users.sh").unlink()
+
+
+def configure_system(base_config: dict, profile_config: dict, profile_name: str, arch: str, rootfs_path: Path):
+    """Write system configuration into the rootfs, then apply it in a chroot."""
+    print("\n=== Configuring rootfs ===")
+
+    # The configuration steps write disjoint files, so run them concurrently
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        rootfs_future = executor.submit(configure_rootfs, base_config, profile_config, profile_name, arch, rootfs_path)
+        users_future = executor.submit(configure_users, rootfs_path, profile_config)
+        network_future = executor.submit(configure_network, rootfs_path, profile_config)
+        fry_future = executor.submit(configure_fry_services, base_config, rootfs_path)
+
+        rootfs_future.result()
+        users_future.result()
+        services = network_future.result() + fry_future.result()
+
+    # Profile files take precedence over the generated configuration
+    copy_profile_files(profile_name, rootfs_path)
+
+    print("\n=== Setting up users and services ===")
+    run_chroot_setup(rootfs_path, services)
+
+
+def get_partition_uuids(devices: list) -> dict:
+    """Read filesystem UUIDs for several block devices with one blkid call."""
+    output = subprocess.check_output([
+        "sudo", "blkid", "-o", "export", *devices
+    ]).decode()
+
+    uuids = {}
+    for block in output.strip().split("\n\n"):
+        fields = dict(line.split("=", 1) for line in block.splitlines() if "=" in line)
+        if "DEVNAME" in fields and "UUID" in fields:
+            uuids[fields["DEVNAME"]] = fields["UUID"]
+    return uuids
 
-def create_disk_image(rootfs_path: Path, profile_name: str, profile_config: dict) -> Path:
+
+def mkfs_supports_populate() -> bool:
+    """Check whether mke2fs can populate a filesystem from a directory (-d, e2fsprogs >= 1.43)."""
+    try:
+        result = subprocess.run(["mke2fs", "-V"], capture_output=True, text=True)
+    except FileNotFoundError:
+        return False
+    match = re.search(r"mke2fs (\d+)\.(\d+)", result.stdout + result.stderr)
+    if not match:
+        return False
+    return (int(match.group(1)), int(match.group(2))) >= (1, 43)
+
+
+def copy_tree_with_tar(src: Path, dst: Path):
+    """Copy a directory tree by streaming it through a tar pipe."""
+    tar_opts = ["--xattrs", "--xattrs-include=*", "--acls", "--numeric-owner"]
+    reader = subprocess.Popen(
+        ["sudo", "tar", "-C", str(src), *tar_opts, "-cf", "-", "."],
+        stdout=subprocess.PIPE,
+    )
+    writer = subprocess.Popen(
+        ["sudo", "tar", "-C", str(dst), *tar_opts, "-xpf", "-"],
+        stdin=reader.stdout,
+    )
+    reader.stdout.close()
+    writer.wait()
+    reader.wait()
+    if reader.returncode != 0:
+        raise subprocess.CalledProcessError(reader.returncode, reader.args)
+    if writer.returncode != 0:
+        raise subprocess.CalledProcessError(writer.returncode, writer.args)
+
+
+def create_disk_image(rootfs_path: Path, profile_name: str, profile_config: dict, arch: str) -> Path:
     """Create a bootable disk image from the rootfs."""
     print("\n=== Creating disk image ===")
 
     image_size = profile_config.get("build", {}).get("image_size", "4G")
     image_path = OUTPUT_DIR / f"fry-iot-{profile_name}.img"
 
-    # Create empty image file
+    # Create empty sparse image file (blocks are only allocated when written)
     print(f"Creating {image_size} disk image...")
-    subprocess.run([
-        "sudo", "dd", "if=/dev/zero", f"of={image_path}",
-        "bs=1M", f"count={int(image_size.rstrip('G')) * 1024}",
-        "status=progress"
-    ], check=True)
+    subprocess.run(["sudo", "rm", "-f", str(image_path)], check=True)
+    subprocess.run(["sudo", "truncate", "-s", image_size, str(image_path)], check=True)
 
     # Create partition table
     print("Creating partition table...")
@@ -512,9 +563,17 @@ def create_disk_image(rootfs_path: Path, profile_name: str, profile_config: dict
         # Format partitions
         print("Formatting partitions...")
         subprocess.run(["sudo", "mkfs.fat", "-F32", f"{loop_device}p1"], check=True)
-        subprocess.run(["sudo", "mkfs.ext4", "-L", "fry-root", f"{loop_device}p2"], check=True)
 
-        # Mount and copy rootfs
+        # Let mke2fs populate the root filesystem directly from the rootfs
+        populate = mkfs_supports_populate()
+        mkfs_cmd = ["sudo", "mkfs.ext4", "-L", "fry-root"]
+        if populate:
+            print("Populating root filesystem from rootfs...")
+            mkfs_cmd.extend(["-d", str(rootfs_path)])
+        mkfs_cmd.append(f"{loop_device}p2")
+        subprocess.run(mkfs_cmd, check=True)
+
+        # Mount the image
         mount_point = WORK_DIR / "mnt"
         mount_point.mkdir(parents=True, exist_ok=True)
 
@@ -525,16 +584,13 @@ def create_disk_image(rootfs_path: Path, profile_name: str, profile_config: dict
         subprocess.run(["sudo", "mkdir", "-p", str(efi_mount)], check=True)
         subprocess.run(["sudo", "mount", f"{loop_device}p1", str(efi_mount)], check=True)
 
-        # Copy rootfs
-        print("Copying rootfs to image...")
-        subprocess.run([
-            "sudo", "rsync", "-aHAX", "--info=progress2",
-            f"{rootfs_path}/", f"{mount_point}/"
-        ], check=True)
+        # Copy rootfs if mke2fs could not populate the filesystem
+        if not populate:
+            print("Copying rootfs to image...")
+            copy_tree_with_tar(rootfs_path, mount_point)
 
         # Install bootloader
         print("Installing bootloader...")
-        arch = get_architecture(profile_config)
         if arch == "amd64":
             subprocess.run([
                 "sudo", "chroot", str(mount_point),
@@ -552,19 +608,21 @@ def create_disk_image(rootfs_path: Path, profile_name: str, profile_config: dict
 
         # Generate fstab
         print("Generating fstab...")
-        root_uuid = subprocess.check_output([
-            "sudo", "blkid", "-s", "UUID", "-o", "value", f"{loop_device}p2"
-        ]).decode().strip()
-        efi_uuid = subprocess.check_output([
-            "sudo", "blkid", "-s", "UUID", "-o", "value", f"{loop_device}p1"
-        ]).decode().strip()
+        uuids = get_partition_uuids([f"{loop_device}p2", f"{loop_device}p1"])
+        root_uuid = uuids[f"{loop_device}p2"]
+        efi_uuid = uuids[f"{loop_device}p1"]
 
         fstab_content = f"""# Fry IoT fstab
 UUID={root_uuid}    /           ext4    errors=remount-ro   0   1
 UUID={efi_uuid}     /boot/efi   vfat    umask=0077          0   1
 """
         fstab_path = mount_point / "etc" / "fstab"
-        subprocess.run(["sudo", "bash", "-c", f"echo '{fstab_content}' > {fstab_path}"], check=True)
+        subprocess.run(
+            ["sudo", "tee", str(fstab_path)],
+            input=fstab_content.encode(),
+            stdout=subprocess.DEVNULL,
+            check=True,
+        )
 
     finally:
         # Unmount and cleanup
@@ -595,21 +653,24 @@ def main():
     print(f"Loading configuration for profile: {profile_name}")
     base_config = load_config()
     profile_config = load_profile_config(profile_name)
+    arch = get_architecture(profile_config)
 
     # Ensure directories exist
     ensure_directories()
 
+    # Optional APT caching proxy (e.g. apt-cacher-ng on http://127.0.0.1:3142)
+    apt_proxy = os.environ.get("FRY_APT_PROXY")
+    if apt_proxy:
+        print(f"Using APT proxy: {apt_proxy}")
+
     # Build rootfs
-    rootfs_path = build_rootfs(base_config, profile_config, profile_name)
+    rootfs_path = build_rootfs(base_config, profile_config, profile_name, arch, apt_proxy)
 
     # Configure rootfs
-    configure_rootfs(base_config, profile_config, profile_name, rootfs_path)
-    configure_users(rootfs_path, profile_config)
-    configure_network(rootfs_path, profile_config)
-    configure_fry_services(base_config, rootfs_path)
+    configure_system(base_config, profile_config, profile_name, arch, rootfs_path)
 
     # Create disk image
-    image_path = create_disk_image(rootfs_path, profile_name, profile_config)
+    image_path = create_disk_image(rootfs_path, profile_name, profile_config, arch)
 
     print(f"""
 ╔══════════════════════════════════════════════════════════════╗
@@ -618,7 +679,7 @@ def main():
 
 Image: {image_path}
 Profile: {profile_name}
-Architecture: {get_architecture(profile_config)}
+Architecture: {arch}
 
 To test in QEMU:
   just test-qemu
@@ -9,51 +9,32 @@ Useful for container deployments or custom image creation.
 import os
 import sys
 import subprocess
-import json
 from pathlib import Path
-
-import toml
+from typing import Optional
+
+from fry_build_common import (
+    CACHE_DIR,
+    load_config,
+    load_profile_config,
+    get_architecture,
+    get_sources_list,
+    get_include_options,
+    get_parallel_unpack_env,
+    get_apt_proxy_options,
+    get_proxied_mirror,
+    get_apt_cache_options,
+    get_rootfs_cache_path,
+    restore_rootfs_cache,
+    save_rootfs_cache,
+    discard_rootfs,
+)
 
 # Project paths
 PROJECT_ROOT = Path(__file__).parent.parent
-BASE_CONFIG_PATH = PROJECT_ROOT / "base-config.toml"
-PROFILES_DIR = PROJECT_ROOT / "profiles"
 WORK_DIR = PROJECT_ROOT / "work"
 TMP_DIR = PROJECT_ROOT / "tmp"
 
 
-def load_config():
-    """Load base configuration."""
-    with open(BASE_CONFIG_PATH) as f:
-        return toml.load(f)
-
-
-def load_profile_config(profile_name: str):
-    """Load profile-specific configuration."""
-    profile_path = PROFILES_DIR / profile_name / "profile-config.toml"
-    if not profile_path.exists():
-        print(f"Error: Profile '{profile_name}' not found at {profile_path}")
-        sys.exit(1)
-    with open(profile_path) as f:
-        return toml.load(f)
-
-
-def get_architecture(profile_config: dict) -> str:
-    """Get Debian architecture from profile config."""
-    arch_mapping = {
-        "x86_64": "amd64",
-        "amd64": "amd64",
-        "arm64": "arm64",
-        "aarch64": "arm64",
-        "armhf": "armhf",
-        "arm": "armhf",
-        "mipsel": "mipsel",
-        "mips": "mips",
-    }
-    arch = profile_config.get("build", {}).get("architecture", "amd64")
-    return arch_mapping.get(arch, arch)
-
-
 def get_kernel_package(arch: str, profile_config: dict) -> str:
     """Get the appropriate kernel package for the architecture."""
     kernel = profile_config.get("build", {}).get("kernel_package")
@@ -84,17 +65,51 @@ def build_package_list(base_config: dict, profile_config: dict, arch: str) -> li
     elif flavor == "server":
         packages.extend(base_config.get("packages", {}).get("server", []))
 
-    exclude = profile_config.get("packages", {}).get("exclude", [])
+    exclude = set(profile_config.get("packages", {}).get("exclude", []))
     packages = [p for p in packages if p not in exclude]
 
-    seen = set()
-    unique_packages = []
-    for p in packages:
-        if p not in seen:
-            seen.add(p)
-            unique_packages.append(p)
+    return list(dict.fromkeys(packages))
+
+
+def create_apt_sources(base_config: dict, rootfs_path: Path):
+    """Create APT sources.list for Debian Trixie."""
+    sources_path = rootfs_path / "etc" / "apt" / "sources.list"
+    subprocess.run(
+        ["sudo", "tee", str(sources_path)],
+        input=get_sources_list(base_config).encode(),
+        stdout=subprocess.DEVNULL,
+        check=True,
+    )
 
-    return unique_packages
+
+def build_rootfs(arch: str, suite: str, mirror: str, components: list, packages: list,
+                 rootfs_path: Path, apt_proxy: Optional[str] = None):
+    """Run mmdebstrap to create the rootfs."""
+    cmd = [
+        "sudo", "env", *get_parallel_unpack_env(), "mmdebstrap",
+        "--arch", arch,
+        "--variant=minbase",
+        *get_include_options(packages),
+        "--components=" + ",".join(components),
+    ]
+
+    # Route downloads through a caching proxy (e.g. apt-cacher-ng) if configured
+    if apt_proxy:
+        print(f"Using APT proxy: {apt_proxy}")
+        cmd.extend(get_apt_proxy_options(apt_proxy))
+        mirror = get_proxied_mirror(mirror)
+
+    # Keep downloaded packages between builds
+    cmd.extend(get_apt_cache_options(CACHE_DIR / f"apt-cache-{arch}"))
+
+    cmd.extend([suite, str(rootfs_path), mirror])
+
+    print(f"\nRunning mmdebstrap...")
+    try:
+        subprocess.run(cmd, check=True)
+    except subprocess.CalledProcessError as e:
+        print(f"Error building rootfs: {e}")
+        sys.exit(1)
 
 
 def main():
@@ -118,17 +133,20 @@ def main():
     arch = get_architecture(profile_config)
     suite = base_config.get("debian", {}).get("suite", "trixie")
     mirror = base_config.get("debian", {}).get("mirror", "https://deb.debian.org/debian")
+    components = base_config.get("debian", {}).get("components", ["main", "contrib", "non-free", "non-free-firmware"])
+    apt_proxy = os.environ.get("FRY_APT_PROXY")
 
     rootfs_path = WORK_DIR / "rootfs"
 
     # Ensure directories
     WORK_DIR.mkdir(parents=True, exist_ok=True)
     TMP_DIR.mkdir(parents=True, exist_ok=True)
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
     # Clean previous rootfs
     if rootfs_path.exists():
         print("Cleaning previous rootfs...")
-        subprocess.run(["sudo", "rm", "-rf", str(rootfs_path)], check=True)
+        discard_rootfs(rootfs_path)
 
     rootfs_path.mkdir(parents=True, exist_ok=True)
 
@@ -138,24 +156,18 @@ def main():
     print(f"Architecture: {arch}")
     print(f"Installing {len(packages)} packages...")
 
-    # Build mmdebstrap command
-    cmd = [
-        "sudo", "mmdebstrap",
-        "--arch", arch,
-        "--variant=minbase",
-        "--include=" + ",".join(packages),
-        "--components=main,contrib,non-free,non-free-firmware",
-        suite,
-        str(rootfs_path),
-        mirror,
-    ]
-
-    print(f"\nRunning mmdebstrap...")
-    try:
-        subprocess.run(cmd, check=True)
-    except subprocess.CalledProcessError as e:
-        print(f"Error building rootfs: {e}")
-        sys.exit(1)
+    # Reuse a cached rootfs if the inputs are unchanged
+    cache_path = get_rootfs_cache_path(arch, suite, mirror, components, packages, apt_proxy)
+    if cache_path.exists():
+        print(f"\nRestoring cached rootfs: {cache_path.name}")
+        restore_rootfs_cache(cache_path, rootfs_path)
+    else:
+        build_rootfs(arch, suite, mirror, components, packages, rootfs_path, apt_proxy)
+        print(f"Caching rootfs: {cache_path.name}")
+        save_rootfs_cache(rootfs_path, cache_path)
+
+    # Replace the mmdebstrap sources (which may point at the APT proxy)
+    create_apt_sources(base_config, rootfs_path)
 
     print(f"""
 ╔══════════════════════════════════════════════════════════════╗
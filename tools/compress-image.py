@@ -6,70 +6,177 @@ Compresses built images using various formats (xz, gzip, zstd).
 """
 
 import os
+import functools
 import sys
+import tomllib
 import subprocess
 import hashlib
+import lzma
+import mmap
+import shutil
+import tempfile
 from pathlib import Path
+from typing import Optional
 from datetime import datetime
-
-import toml
-from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # Project paths
 PROJECT_ROOT = Path(__file__).parent.parent
 BASE_CONFIG_PATH = PROJECT_ROOT / "base-config.toml"
 OUTPUT_DIR = PROJECT_ROOT / "output"
 
+# Output suffix for each supported compression format
+COMPRESSION_SUFFIXES = {
+    "xz": ".xz",
+    "gz": ".gz",
+    "gzip": ".gz",
+    "zstd": ".zst",
+}
+
+# Files smaller than this are cheap to hash and skip the checksum cache
+SHA256_CACHE_MIN_SIZE = 16 * 1024 * 1024
+
 
+@functools.lru_cache(maxsize=None)
 def load_config():
     """Load base configuration."""
-    with open(BASE_CONFIG_PATH) as f:
-        return toml.load(f)
+    with open(BASE_CONFIG_PATH, "rb") as f:
+        return tomllib.load(f)
+
+
+def read_cached_sha256(file_path: Path) -> Optional[str]:
+    """Return the cached SHA256 of a file if its size and mtime are unchanged."""
+    stat = file_path.stat()
+    cache_path = file_path.with_name(file_path.name + ".sha256")
+    try:
+        size, mtime_ns, digest = cache_path.read_text().split()
+    except (OSError, ValueError):
+        return None
+    if int(size) == stat.st_size and int(mtime_ns) == stat.st_mtime_ns:
+        return digest
+    return None
+
+
+def write_cached_sha256(file_path: Path, digest: str):
+    """Store the SHA256 of a file in a .sha256 sidecar keyed by size and mtime."""
+    stat = file_path.stat()
+    if stat.st_size < SHA256_CACHE_MIN_SIZE:
+        return
+    cache_path = file_path.with_name(file_path.name + ".sha256")
+    partial_path = cache_path.with_name(cache_path.name + ".part")
+    partial_path.write_text(f"{stat.st_size} {stat.st_mtime_ns} {digest}\n")
+    partial_path.rename(cache_path)
 
 
 def calculate_sha256(file_path: Path) -> str:
-    """Calculate SHA256 hash of a file."""
-    sha256_hash = hashlib.sha256()
+    """Calculate SHA256 hash of a file, reusing a cached digest when possible."""
+    if file_path.stat().st_size >= SHA256_CACHE_MIN_SIZE:
+        cached = read_cached_sha256(file_path)
+        if cached:
+            return cached
+
     with open(file_path, "rb") as f:
-        for byte_block in iter(lambda: f.read(4096), b""):
-            sha256_hash.update(byte_block)
+        if os.fstat(f.fileno()).st_size == 0:
+            digest = hashlib.sha256().hexdigest()
+        elif sys.maxsize <= 2**32:
+            # 32-bit builders cannot map a multi-GB image in one go; stream it instead
+            digest = hashlib.file_digest(f, "sha256").hexdigest()
+        else:
+            # Hash straight from the page cache instead of copying through read() buffers
+            with mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ) as mm:
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+                digest = hashlib.sha256(mm).hexdigest()
+    write_cached_sha256(file_path, digest)
+    return digest
+
+
+def run_compressor(cmd: list, partial_path: Path, log: list) -> Optional[str]:
+    """Stream a compressor's stdout to a file and return its SHA256 (None on failure, reported in log)."""
+    # Hash the compressed stream while writing it, so the output is not read back
+    sha256_hash = hashlib.sha256()
+    # stderr goes to a temporary file rather than a pipe, so a chatty compressor
+    # can neither fill an undrained pipe nor grow our memory; it is only read on failure
+    with tempfile.TemporaryFile() as errors:
+        with open(partial_path, "wb") as out:
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=errors)
+            while chunk := proc.stdout.read(1 << 20):
+                out.write(chunk)
+                sha256_hash.update(chunk)
+            proc.stdout.close()
+            returncode = proc.wait()
+        if returncode != 0:
+            partial_path.unlink(missing_ok=True)
+            errors.seek(0)
+            log.append(f"  Compression failed: {cmd[0]} exited with status {returncode}")
+            log.extend(f"    {line}" for line in errors.read().decode(errors="replace").splitlines())
+            return None
+    return sha256_hash.hexdigest()
+
+
+def compress_with_lzma(file_path: Path, partial_path: Path) -> str:
+    """Compress a file to .xz with the stdlib lzma module and return its SHA256."""
+    sha256_hash = hashlib.sha256()
+    compressor = lzma.LZMACompressor(preset=9)
+    with open(file_path, "rb") as src, open(partial_path, "wb") as out:
+        while chunk := src.read(1 << 20):
+            data = compressor.compress(chunk)
+            out.write(data)
+            sha256_hash.update(data)
+        data = compressor.flush()
+        out.write(data)
+        sha256_hash.update(data)
     return sha256_hash.hexdigest()
 
 
-def compress_file(file_path: Path, compression: str = "xz") -> Path:
-    """Compress a file using the specified algorithm."""
-    output_path = Path(str(file_path) + f".{compression}")
+def get_output_path(file_path: Path, compression: str) -> Optional[Path]:
+    """Get the compressed output path for a file (None for an unknown format)."""
+    if compression not in COMPRESSION_SUFFIXES:
+        return None
+    return file_path.with_suffix(file_path.suffix + COMPRESSION_SUFFIXES[compression])
+
+
+def compress_file(file_path: Path, compression: str = "zstd", level: int = 19, threads: int = 0) -> tuple:
+    """Compress a file and return the output path, its SHA256 (None if not computed) and log lines.
+
+    Runs in a worker process, so progress is returned for the parent to print
+    instead of being written to a shared stdout.
+    """
+    log = []
+    output_path = get_output_path(file_path, compression)
+    if output_path is None:
+        log.append(f"  Unknown compression format: {compression}")
+        return file_path, None, log
 
     if output_path.exists():
-        print(f"  Compressed file already exists: {output_path.name}")
-        return output_path
+        log.append(f"  Compressed file already exists: {output_path.name}")
+        return output_path, None, log
 
     file_size = file_path.stat().st_size
-    print(f"  Compressing: {file_path.name} ({file_size / (1024*1024):.1f} MB)")
 
     if compression == "xz":
-        cmd = ["xz", "-k", "-9", "-T0", str(file_path)]
-    elif compression == "gz" or compression == "gzip":
-        cmd = ["gzip", "-k", "-9", str(file_path)]
-        output_path = Path(str(file_path) + ".gz")
+        # Without the xz binary fall back to the (single-threaded) stdlib encoder
+        cmd = ["xz", "-c", "-9", f"-T{threads}", str(file_path)] if shutil.which("xz") else None
     elif compression == "zstd":
-        cmd = ["zstd", "-k", "-19", "-T0", str(file_path)]
-        output_path = Path(str(file_path) + ".zst")
+        # --long=27 uses a 128 MiB match window, which suits large, repetitive disk images
+        cmd = ["zstd", "-c", "--long=27", f"-{level}", f"-T{threads}", str(file_path)]
     else:
-        print(f"  Unknown compression format: {compression}")
-        return file_path
+        cmd = ["gzip", "-c", "-9", str(file_path)]
 
-    try:
-        subprocess.run(cmd, check=True, capture_output=True)
-    except subprocess.CalledProcessError as e:
-        print(f"  Compression failed: {e}")
-        return file_path
+    partial_path = output_path.with_name(output_path.name + ".part")
+    if cmd is None:
+        digest = compress_with_lzma(file_path, partial_path)
+    else:
+        digest = run_compressor(cmd, partial_path, log)
+        if digest is None:
+            return file_path, None, log
+    partial_path.rename(output_path)
+    write_cached_sha256(output_path, digest)
 
     compressed_size = output_path.stat().st_size
     ratio = (1 - compressed_size / file_size) * 100
-    print(f"  Created: {output_path.name} ({compressed_size / (1024*1024):.1f} MB, {ratio:.1f}% smaller)")
+    log.append(f"  Created: {output_path.name} ({compressed_size / (1024*1024):.1f} MB, {ratio:.1f}% smaller)")
 
-    return output_path
+    return output_path, digest, log
 
 
 def main():
@@ -82,7 +189,9 @@ def main():
 
     # Load config
     base_config = load_config()
-    compression = base_config.get("build", {}).get("compression", "xz")
+    build_config = base_config.get("build", {})
+    compression = build_config.get("compression", "zstd")
+    level = build_config.get("compression_level", 19)
 
     print(f"Compression format: {compression}")
     print()
@@ -98,23 +207,39 @@ def main():
         print(f"  - {img.name}")
     print()
 
-    # Compress each image
-    compressed_files = []
-    for image_path in images:
-        compressed_path = compress_file(image_path, compression)
-        compressed_files.append(compressed_path)
+    # Compress all images at once, splitting the cores between them; a file that
+    # was not hashed while compressing is hashed as soon as its compression ends,
+    # overlapping with the images still being compressed
+    threads = max(1, (os.cpu_count() or 1) // len(images))
+    with ProcessPoolExecutor(max_workers=len(images)) as executor:
+        compress_futures = {}
+        for index, image in enumerate(images):
+            output_path = get_output_path(image, compression)
+            if output_path is not None and not output_path.exists():
+                print(f"  Compressing: {image.name} ({image.stat().st_size / (1024*1024):.1f} MB)")
+            compress_futures[executor.submit(compress_file, image, compression, level, threads)] = index
 
-    print()
-    print("Generating checksums...")
+        # Workers return their log lines, so each result is printed whole here
+        compressed_files = [None] * len(images)
+        hash_futures = [None] * len(images)
+        for future in as_completed(compress_futures):
+            index = compress_futures[future]
+            path, sha256, log = future.result()
+            print("\n".join(log))
+            compressed_files[index] = path
+            hash_futures[index] = sha256 if sha256 is not None else executor.submit(calculate_sha256, path)
+
+        print()
+        print("Generating checksums...")
+        checksums = [h if isinstance(h, str) else h.result() for h in hash_futures]
 
     # Generate checksums
     checksums_path = OUTPUT_DIR / "SHA256SUMS"
-    with open(checksums_path, "w") as f:
-        for file_path in compressed_files:
-            sha256 = calculate_sha256(file_path)
-            f.write(f"{sha256}  {file_path.name}\n")
-            print(f"  {file_path.name}: {sha256[:16]}...")
+    checksums_path.write_text("".join(
+        f"{sha256}  {file_path.name}\n" for file_path, sha256 in zip(compressed_files, checksums)
+    ))
 
+    print("\n".join(f"  {file_path.name}: {sha256[:16]}..." for file_path, sha256 in zip(compressed_files, checksums)))
     print(f"\nChecksums written to: {checksums_path}")
 
     print(f"""
@@ -7,70 +7,24 @@ node management, and network contribution features.
 """
 
 import os
+import functools
 import sys
+import tomllib
 import json
 from pathlib import Path
-
-import toml
+from concurrent.futures import ThreadPoolExecutor
 
 # Project paths
 PROJECT_ROOT = Path(__file__).parent.parent
 BASE_CONFIG_PATH = PROJECT_ROOT / "base-config.toml"
 WORK_DIR = PROJECT_ROOT / "work"
+FILES_DIR = WORK_DIR / "files"
+FRY_CONFIG_DIR = FILES_DIR / "etc" / "fry"
+SYSTEMD_DIR = FILES_DIR / "etc" / "systemd" / "system"
+BIN_DIR = FILES_DIR / "usr" / "local" / "bin"
 
-
-def load_config():
-    """Load base configuration."""
-    with open(BASE_CONFIG_PATH) as f:
-        return toml.load(f)
-
-
-def generate_fry_config(base_config: dict):
-    """Generate Fry Networks configuration files."""
-    fry_config = base_config.get("fry", {})
-
-    # Create Fry config directory
-    fry_dir = WORK_DIR / "files" / "etc" / "fry"
-    fry_dir.mkdir(parents=True, exist_ok=True)
-
-    # Main configuration
-    config = {
-        "api_endpoint": fry_config.get("api_endpoint", "https://api.fry.network"),
-        "bandwidth_mining": fry_config.get("bandwidth_mining", True),
-        "node_type": fry_config.get("node_type", "router"),
-        "auto_register": True,
-        "telemetry": {
-            "enabled": True,
-            "interval": 60,
-        },
-        "bandwidth": {
-            "enabled": fry_config.get("bandwidth_mining", True),
-            "max_share_percent": 50,
-            "min_bandwidth_mbps": 1,
-        },
-        "network": {
-            "upnp": True,
-            "nat_pmp": True,
-            "stun_servers": [
-                "stun:stun.l.google.com:19302",
-                "stun:stun.fry.network:3478",
-            ],
-        },
-    }
-
-    config_path = fry_dir / "config.json"
-    with open(config_path, "w") as f:
-        json.dump(config, f, indent=2)
-    print(f"Generated: {config_path}")
-
-
-def generate_fry_services():
-    """Generate systemd service files for Fry Networks."""
-    systemd_dir = WORK_DIR / "files" / "etc" / "systemd" / "system"
-    systemd_dir.mkdir(parents=True, exist_ok=True)
-
-    # Fry Node Service
-    fry_node_service = """[Unit]
+# Fry Node Service
+FRY_NODE_SERVICE = """[Unit]
 Description=Fry Network Node
 Documentation=https://docs.fry.network/
 After=network-online.target
@@ -98,12 +52,9 @@ PrivateTmp=yes
 [Install]
 WantedBy=multi-user.target
 """
-    node_path = systemd_dir / "fry-node.service"
-    node_path.write_text(fry_node_service)
-    print(f"Generated: {node_path}")
 
-    # Bandwidth Miner Service
-    bandwidth_miner_service = """[Unit]
+# Bandwidth Miner Service
+BANDWIDTH_MINER_SERVICE = """[Unit]
 Description=Fry Bandwidth Miner
 Documentation=https://docs.fry.network/bandwidth-mining
 After=network-online.target fry-node.service
@@ -136,12 +87,9 @@ CPUQuota=50%
 [Install]
 WantedBy=multi-user.target
 """
-    miner_path = systemd_dir / "bandwidth-miner.service"
-    miner_path.write_text(bandwidth_miner_service)
-    print(f"Generated: {miner_path}")
 
-    # Fry Dashboard Service (optional web UI)
-    dashboard_service = """[Unit]
+# Fry Dashboard Service (optional web UI)
+FRY_DASHBOARD_SERVICE = """[Unit]
 Description=Fry Dashboard Web UI
 Documentation=https://docs.fry.network/dashboard
 After=network-online.target fry-node.service
@@ -166,12 +114,9 @@ PrivateTmp=yes
 [Install]
 WantedBy=multi-user.target
 """
-    dashboard_path = systemd_dir / "fry-dashboard.service"
-    dashboard_path.write_text(dashboard_service)
-    print(f"Generated: {dashboard_path}")
 
-    # Fry Update Timer
-    update_timer = """[Unit]
+# Fry Update Timer
+FRY_UPDATE_TIMER = """[Unit]
 Description=Fry IoT automatic update check
 
 [Timer]
@@ -182,12 +127,9 @@ RandomizedDelaySec=30min
 [Install]
 WantedBy=timers.target
 """
-    timer_path = systemd_dir / "fry-update.timer"
-    timer_path.write_text(update_timer)
-    print(f"Generated: {timer_path}")
 
-    # Fry Update Service
-    update_service = """[Unit]
+# Fry Update Service
+FRY_UPDATE_SERVICE = """[Unit]
 Description=Fry IoT Update Check
 After=network-online.target
 Wants=network-online.target
@@ -197,18 +139,9 @@ Type=oneshot
 ExecStart=/usr/bin/fry-cli update --check
 User=root
 """
-    update_service_path = systemd_dir / "fry-update.service"
-    update_service_path.write_text(update_service)
-    print(f"Generated: {update_service_path}")
-
-
-def generate_fry_scripts():
-    """Generate helper scripts for Fry Networks."""
-    bin_dir = WORK_DIR / "files" / "usr" / "local" / "bin"
-    bin_dir.mkdir(parents=True, exist_ok=True)
 
-    # First boot registration script
-    first_boot_script = """#!/bin/bash
+# First boot registration script
+FIRST_BOOT_SCRIPT = """#!/bin/bash
 # Fry IoT First Boot Setup
 
 set -e
@@ -286,13 +219,9 @@ touch "$FIRST_BOOT_DONE"
 echo "First boot setup complete!"
 echo "Dashboard available at: http://$(hostname -I | awk '{print $1}'):8080"
 """
-    first_boot_path = bin_dir / "fry-first-boot.sh"
-    first_boot_path.write_text(first_boot_script)
-    first_boot_path.chmod(0o755)
-    print(f"Generated: {first_boot_path}")
 
-    # Status check script
-    status_script = """#!/bin/bash
+# Status check script
+STATUS_SCRIPT = """#!/bin/bash
 # Fry IoT Status Check
 
 echo "╔══════════════════════════════════════════════════════════════╗"
@@ -336,18 +265,9 @@ echo ""
 echo "Dashboard: http://$(hostname -I | awk '{print $1}'):8080"
 echo ""
 """
-    status_path = bin_dir / "fry-status"
-    status_path.write_text(status_script)
-    status_path.chmod(0o755)
-    print(f"Generated: {status_path}")
-
-
-def generate_first_boot_service():
-    """Generate first boot systemd service."""
-    systemd_dir = WORK_DIR / "files" / "etc" / "systemd" / "system"
-    systemd_dir.mkdir(parents=True, exist_ok=True)
 
-    first_boot_service = """[Unit]
+# First boot setup service
+FIRST_BOOT_SERVICE = """[Unit]
 Description=Fry IoT First Boot Setup
 After=local-fs.target network.target
 Before=fry-node.service
@@ -363,9 +283,78 @@ StandardError=journal+console
 [Install]
 WantedBy=multi-user.target
 """
-    service_path = systemd_dir / "fry-first-boot.service"
-    service_path.write_text(first_boot_service)
-    print(f"Generated: {service_path}")
+
+
+@functools.lru_cache(maxsize=None)
+def load_config():
+    """Load base configuration."""
+    with open(BASE_CONFIG_PATH, "rb") as f:
+        return tomllib.load(f)
+
+
+def generate_fry_config(base_config: dict):
+    """Generate Fry Networks configuration files."""
+    fry_config = base_config.get("fry", {})
+
+    # Main configuration
+    config = {
+        "api_endpoint": fry_config.get("api_endpoint", "https://api.fry.network"),
+        "bandwidth_mining": fry_config.get("bandwidth_mining", True),
+        "node_type": fry_config.get("node_type", "router"),
+        "auto_register": True,
+        "telemetry": {
+            "enabled": True,
+            "interval": 60,
+        },
+        "bandwidth": {
+            "enabled": fry_config.get("bandwidth_mining", True),
+            "max_share_percent": 50,
+            "min_bandwidth_mbps": 1,
+        },
+        "network": {
+            "upnp": True,
+            "nat_pmp": True,
+            "stun_servers": [
+                "stun:stun.l.google.com:19302",
+                "stun:stun.fry.network:3478",
+            ],
+        },
+    }
+
+    return [(FRY_CONFIG_DIR / "config.json", json.dumps(config, indent=2), None)]
+
+
+def generate_fry_services():
+    """Generate systemd service files for Fry Networks."""
+    return [
+        (SYSTEMD_DIR / "fry-node.service", FRY_NODE_SERVICE, None),
+        (SYSTEMD_DIR / "bandwidth-miner.service", BANDWIDTH_MINER_SERVICE, None),
+        (SYSTEMD_DIR / "fry-dashboard.service", FRY_DASHBOARD_SERVICE, None),
+        (SYSTEMD_DIR / "fry-update.timer", FRY_UPDATE_TIMER, None),
+        (SYSTEMD_DIR / "fry-update.service", FRY_UPDATE_SERVICE, None),
+    ]
+
+
+def generate_fry_scripts():
+    """Generate helper scripts for Fry Networks."""
+    return [
+        (BIN_DIR / "fry-first-boot.sh", FIRST_BOOT_SCRIPT, 0o755),
+        (BIN_DIR / "fry-status", STATUS_SCRIPT, 0o755),
+    ]
+
+
+def generate_first_boot_service():
+    """Generate first boot systemd service."""
+    return [(SYSTEMD_DIR / "fry-first-boot.service", FIRST_BOOT_SERVICE, None)]
+
+
+def write_generated_file(entry: tuple) -> Path:
+    """Write a generated (path, content, mode) entry to disk."""
+    path, content, mode = entry
+    path.write_text(content)
+    if mode is not None:
+        path.chmod(mode)
+    return path
 
 
 def main():
@@ -378,12 +367,21 @@ def main():
 
     base_config = load_config()
 
-    WORK_DIR.mkdir(parents=True, exist_ok=True)
-
-    generate_fry_config(base_config)
-    generate_fry_services()
-    generate_fry_scripts()
-    generate_first_boot_service()
+    files = [
+        *generate_fry_config(base_config),
+        *generate_fry_services(),
+        *generate_fry_scripts(),
+        *generate_first_boot_service(),
+    ]
+
+    # Create each output directory once, before the files are written concurrently
+    for output_dir in {path.parent for path, _, _ in files}:
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+    # Each file is independent, so write them concurrently
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for path in executor.map(write_generated_file, files):
+            print(f"Generated: {path}")
 
     print("\nFry Networks configuration complete!")
     print("\nServices configured:")
@@ -8,12 +8,14 @@ Reads base-config.toml and profile-config.toml to create build artifacts.
 
 import os
 import sys
+import functools
+import tomllib
 import json
 import shutil
+import itertools
 from pathlib import Path
-from datetime import datetime
-
-import toml
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
 
 # Project paths
 PROJECT_ROOT = Path(__file__).parent.parent
@@ -23,21 +25,47 @@ WORK_DIR = PROJECT_ROOT / "work"
 OUTPUT_DIR = PROJECT_ROOT / "output"
 TMP_DIR = PROJECT_ROOT / "tmp"
 
+# Profile architecture names mapped to Debian architectures
+ARCH_MAPPING = {
+    "x86_64": "amd64",
+    "amd64": "amd64",
+    "arm64": "arm64",
+    "aarch64": "arm64",
+    "armhf": "armhf",
+    "arm": "armhf",
+    "mipsel": "mipsel",
+    "mips": "mips",
+}
+
+# Banner logo used when resources/ascii-logo is missing
+DEFAULT_LOGO = """
+  ______              _____    _______
+ |  ____|            |_   _|  |__   __|
+ | |__ _ __ _   _      | |  ___  | |
+ |  __| '__| | | |     | | / _ \\ | |
+ | |  | |  | |_| |    _| || (_) || |
+ |_|  |_|   \\__, |   |_____\\___/ |_|
+             __/ |
+            |___/
+"""
+
 
+@functools.lru_cache(maxsize=None)
 def load_config():
     """Load base configuration."""
-    with open(BASE_CONFIG_PATH) as f:
-        return toml.load(f)
+    with open(BASE_CONFIG_PATH, "rb") as f:
+        return tomllib.load(f)
 
 
+@functools.lru_cache(maxsize=None)
 def load_profile_config(profile_name: str):
     """Load profile-specific configuration."""
     profile_path = PROFILES_DIR / profile_name / "profile-config.toml"
     if not profile_path.exists():
         print(f"Error: Profile '{profile_name}' not found at {profile_path}")
         sys.exit(1)
-    with open(profile_path) as f:
-        return toml.load(f)
+    with open(profile_path, "rb") as f:
+        return tomllib.load(f)
 
 
 def ensure_directories():
@@ -48,27 +76,16 @@ def ensure_directories():
 
 def get_architecture(profile_config: dict) -> str:
     """Get Debian architecture from profile config."""
-    arch_mapping = {
-        "x86_64": "amd64",
-        "amd64": "amd64",
-        "arm64": "arm64",
-        "aarch64": "arm64",
-        "armhf": "armhf",
-        "arm": "armhf",
-        "mipsel": "mipsel",
-        "mips": "mips",
-    }
     arch = profile_config.get("build", {}).get("architecture", "amd64")
-    return arch_mapping.get(arch, arch)
+    return ARCH_MAPPING.get(arch, arch)
 
 
-def generate_build_config(base_config: dict, profile_config: dict, profile_name: str):
+def generate_build_config(base_config: dict, profile_config: dict, profile_name: str, arch: str, build_date: str):
     """Generate the build configuration file."""
     print("Generating build configuration...")
 
     os_name = base_config.get("general", {}).get("os_name", "fry-iot")
     os_version = base_config.get("general", {}).get("os_version", "1.0.0")
-    arch = get_architecture(profile_config)
     codename = profile_config.get("general", {}).get("codename", profile_name)
 
     build_config = {
@@ -76,7 +93,7 @@ def generate_build_config(base_config: dict, profile_config: dict, profile_name:
             "name": os_name,
             "version": os_version,
             "codename": codename,
-            "build_date": datetime.utcnow().isoformat() + "Z",
+            "build_date": build_date,
         },
         "debian": {
             "suite": base_config.get("debian", {}).get("suite", "trixie"),
@@ -88,7 +105,7 @@ def generate_build_config(base_config: dict, profile_config: dict, profile_name:
             "profile": profile_name,
             "image_size": profile_config.get("build", {}).get("image_size", base_config.get("build", {}).get("image_size", "4G")),
             "rootfs_type": base_config.get("build", {}).get("rootfs_type", "ext4"),
-            "compression": base_config.get("build", {}).get("compression", "xz"),
+            "compression": base_config.get("build", {}).get("compression", "zstd"),
         },
         "device": {
             "name": codename,
@@ -98,25 +115,23 @@ def generate_build_config(base_config: dict, profile_config: dict, profile_name:
         "fry": base_config.get("fry", {}),
     }
 
-    # Merge packages
-    packages = []
-    packages.extend(base_config.get("packages", {}).get("core", []))
-    packages.extend(base_config.get("packages", {}).get("iot", []))
-    packages.extend(profile_config.get("packages", {}).get("include", []))
-
     # Handle flavor-specific packages
+    package_config = base_config.get("packages", {})
     flavor = profile_config.get("build", {}).get("flavor", "minimal")
-    if flavor == "desktop":
-        packages.extend(base_config.get("packages", {}).get("desktop", []))
-    elif flavor == "server":
-        packages.extend(base_config.get("packages", {}).get("server", []))
-
-    # Remove excluded packages
-    exclude = profile_config.get("packages", {}).get("exclude", [])
-    packages = [p for p in packages if p not in exclude]
-
-    # Remove duplicates
-    packages = list(dict.fromkeys(packages))
+    flavor_packages = package_config.get(flavor, []) if flavor in ("desktop", "server") else []
+
+    # Merge packages in one pass, dropping excluded packages and duplicates
+    exclude = set(profile_config.get("packages", {}).get("exclude", []))
+    seen = {}
+    for package in itertools.chain(
+        package_config.get("core", []),
+        package_config.get("iot", []),
+        profile_config.get("packages", {}).get("include", []),
+        flavor_packages,
+    ):
+        if package not in exclude and package not in seen:
+            seen[package] = None
+    packages = list(seen)
 
     build_config["packages"] = packages
 
@@ -129,7 +144,7 @@ def generate_build_config(base_config: dict, profile_config: dict, profile_name:
     return build_config
 
 
-def generate_device_info(profile_config: dict, profile_name: str, os_version: str):
+def generate_device_info(profile_config: dict, profile_name: str, os_version: str, arch: str):
     """Generate device info JSON."""
     print("Generating device info...")
 
@@ -140,7 +155,7 @@ def generate_device_info(profile_config: dict, profile_name: str, os_version: st
         "brand": profile_config.get("general", {}).get("brand", "Fry"),
         "model": profile_config.get("general", {}).get("model", codename),
         "version": os_version,
-        "architecture": get_architecture(profile_config),
+        "architecture": arch,
     }
 
     info_path = TMP_DIR / "device.json"
@@ -151,41 +166,33 @@ def generate_device_info(profile_config: dict, profile_name: str, os_version: st
     return device_info
 
 
-def generate_banner(base_config: dict, profile_config: dict, profile_name: str):
+def generate_banner(base_config: dict, profile_config: dict, profile_name: str, arch: str):
     """Generate system banner/MOTD."""
     print("Generating system banner...")
 
     os_version = base_config.get("general", {}).get("os_version", "1.0.0")
     codename = profile_config.get("general", {}).get("codename", profile_name)
-    arch = get_architecture(profile_config)
 
     # Read ASCII logo if available
     logo_path = PROJECT_ROOT / "resources" / "ascii-logo"
     if logo_path.exists():
         logo = logo_path.read_text()
     else:
-        logo = """
-  ______              _____    _______
- |  ____|            |_   _|  |__   __|
- | |__ _ __ _   _      | |  ___  | |
- |  __| '__| | | |     | | / _ \\ | |
- | |  | |  | |_| |    _| || (_) || |
- |_|  |_|   \\__, |   |_____\\___/ |_|
-             __/ |
-            |___/
-"""
-
-    banner = f"""{logo}
- Fry IoT v{os_version} - {codename} ({arch})
- Debian 13 (Trixie) based Linux for IoT devices
-
- Contribute to Fry Networks: https://fry.network/
- Documentation: https://docs.fry.network/
-
- Default credentials: fry / fryiot
- SSH enabled on port 22
-
-"""
+        logo = DEFAULT_LOGO
+
+    banner = "\n".join([
+        logo,
+        f" Fry IoT v{os_version} - {codename} ({arch})",
+        " Debian 13 (Trixie) based Linux for IoT devices",
+        "",
+        " Contribute to Fry Networks: https://fry.network/",
+        " Documentation: https://docs.fry.network/",
+        "",
+        " Default credentials: fry / fryiot",
+        " SSH enabled on port 22",
+        "",
+        "",
+    ])
 
     banner_path = TMP_DIR / "banner"
     banner_path.write_text(banner)
@@ -194,6 +201,62 @@ def generate_banner(base_config: dict, profile_config: dict, profile_name: str):
     return banner
 
 
+def remove_stale_files(directory: Path, keep: set) -> int:
+    """Delete files under a directory that are not in keep, pruning emptied directories."""
+    removed = 0
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            path = Path(entry.path)
+            if entry.is_dir(follow_symlinks=False):
+                removed += remove_stale_files(path, keep)
+                if path not in keep and not any(path.iterdir()):
+                    path.rmdir()
+            elif path not in keep:
+                path.unlink()
+                removed += 1
+    return removed
+
+
+def is_up_to_date(src: Path, dst: Path) -> bool:
+    """Check whether dst is an earlier copy2 of src (same size and mtime)."""
+    try:
+        dst_stat = dst.stat()
+    except FileNotFoundError:
+        return False
+    src_stat = src.stat()
+    return (dst_stat.st_size, dst_stat.st_mtime_ns) == (src_stat.st_size, src_stat.st_mtime_ns)
+
+
+def sync_tree(executor, src_root: Path, dst_root: Path, describe, suffixes: tuple = ()) -> tuple:
+    """Submit copies of changed files under src_root to executor.
+
+    Returns the set of destination paths to keep, a list of (future, message)
+    pairs for the submitted copies and the number of files already up to date.
+    With suffixes set, only matching top-level files are synced. Subdirectories
+    are only created when they receive files, like a fresh copy would.
+    """
+    dst_root.mkdir(parents=True, exist_ok=True)
+    keep = {dst_root}
+    copies = []
+    unchanged = 0
+    for directory, dirs, names in os.walk(src_root, followlinks=True):
+        if suffixes:
+            dirs.clear()
+        target_dir = dst_root / Path(directory).relative_to(src_root)
+        for name in names:
+            if suffixes and not name.endswith(suffixes):
+                continue
+            src = Path(directory) / name
+            dst = target_dir / name
+            keep.add(dst)
+            if is_up_to_date(src, dst):
+                unchanged += 1
+            else:
+                target_dir.mkdir(parents=True, exist_ok=True)
+                copies.append((executor.submit(shutil.copy2, src, dst), describe(dst)))
+    return keep, copies, unchanged
+
+
 def copy_profile_files(profile_name: str):
     """Copy profile-specific files to work directory."""
     print("Copying profile files...")
@@ -201,42 +264,49 @@ def copy_profile_files(profile_name: str):
     profile_dir = PROFILES_DIR / profile_name
     work_files_dir = WORK_DIR / "files"
 
-    # Clean and create work files directory
-    if work_files_dir.exists():
+    # Sync into the existing work files directory; FRY_CLEAN=1 starts from scratch
+    if os.environ.get("FRY_CLEAN") == "1" and work_files_dir.exists():
         shutil.rmtree(work_files_dir)
     work_files_dir.mkdir(parents=True, exist_ok=True)
 
-    # Copy files from profile
-    profile_files = profile_dir / "files"
-    if profile_files.exists():
-        for src_file in profile_files.rglob("*"):
-            if src_file.is_file():
-                rel_path = src_file.relative_to(profile_files)
-                dst_file = work_files_dir / rel_path
-                dst_file.parent.mkdir(parents=True, exist_ok=True)
-                shutil.copy2(src_file, dst_file)
-                print(f"  Copied: {rel_path}")
-
-    # Copy systemd units from profile
-    systemd_dir = profile_dir / "systemd"
-    if systemd_dir.exists():
-        dst_systemd = work_files_dir / "etc" / "systemd" / "system"
-        dst_systemd.mkdir(parents=True, exist_ok=True)
-        for unit_file in systemd_dir.glob("*.service"):
-            shutil.copy2(unit_file, dst_systemd / unit_file.name)
-            print(f"  Copied systemd unit: {unit_file.name}")
-        for unit_file in systemd_dir.glob("*.timer"):
-            shutil.copy2(unit_file, dst_systemd / unit_file.name)
-            print(f"  Copied systemd timer: {unit_file.name}")
-
-    # Copy network configuration from profile
-    network_dir = profile_dir / "network"
-    if network_dir.exists():
-        dst_network = work_files_dir / "etc" / "systemd" / "network"
-        dst_network.mkdir(parents=True, exist_ok=True)
-        for network_file in network_dir.glob("*.network"):
-            shutil.copy2(network_file, dst_network / network_file.name)
-            print(f"  Copied network config: {network_file.name}")
+    # (source, destination, message for a copied file, suffix filter)
+    trees = [
+        (
+            profile_dir / "files", work_files_dir,
+            lambda dst: f"Copied: {dst.relative_to(work_files_dir)}",
+            (),
+        ),
+        (
+            profile_dir / "systemd", work_files_dir / "etc" / "systemd" / "system",
+            lambda dst: f"Copied systemd {'unit' if dst.suffix == '.service' else 'timer'}: {dst.name}",
+            (".service", ".timer"),
+        ),
+        (
+            profile_dir / "network", work_files_dir / "etc" / "systemd" / "network",
+            lambda dst: f"Copied network config: {dst.name}",
+            (".network",),
+        ),
+    ]
+
+    # Changed files are copied on a thread pool and reported once they finish
+    keep = set()
+    copies = []
+    unchanged = 0
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for src_root, dst_root, describe, suffixes in trees:
+            if src_root.exists():
+                tree_keep, tree_copies, tree_unchanged = sync_tree(executor, src_root, dst_root, describe, suffixes)
+                keep |= tree_keep
+                copies.extend(tree_copies)
+                unchanged += tree_unchanged
+
+        for future, message in copies:
+            future.result()
+            print(f"  {message}")
+
+    removed = remove_stale_files(work_files_dir, keep)
+    if unchanged or removed:
+        print(f"  {unchanged} file(s) unchanged, {removed} stale file(s) removed")
 
 
 def generate_sources_list(base_config: dict):
@@ -249,13 +319,14 @@ def generate_sources_list(base_config: dict):
     components = base_config.get("debian", {}).get("components", ["main", "contrib", "non-free", "non-free-firmware"])
     components_str = " ".join(components)
 
-    sources_content = f"""# Fry IoT - Debian {suite} sources
-# Auto-generated by configure.py
-
-deb {mirror} {suite} {components_str}
-deb {mirror} {suite}-updates {components_str}
-deb {security_mirror} {suite}-security {components_str}
-"""
+    sources_content = "\n".join([
+        f"# Fry IoT - Debian {suite} sources",
+        "# Auto-generated by configure.py",
+        "",
+        *(f"deb {mirror} {suite}{suffix} {components_str}" for suffix in ("", "-updates")),
+        f"deb {security_mirror} {suite}-security {components_str}",
+        "",
+    ])
 
     sources_path = TMP_DIR / "sources.list"
     sources_path.write_text(sources_content)
@@ -299,10 +370,12 @@ def main():
 
     # Generate configurations
     os_version = base_config.get("general", {}).get("os_version", "1.0.0")
+    arch = get_architecture(profile_config)
+    build_date = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
 
-    build_config = generate_build_config(base_config, profile_config, profile_name)
-    device_info = generate_device_info(profile_config, profile_name, os_version)
-    banner = generate_banner(base_config, profile_config, profile_name)
+    build_config = generate_build_config(base_config, profile_config, profile_name, arch, build_date)
+    device_info = generate_device_info(profile_config, profile_name, os_version, arch)
+    banner = generate_banner(base_config, profile_config, profile_name, arch)
     generate_sources_list(base_config)
     copy_profile_files(profile_name)
 
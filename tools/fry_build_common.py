@@ -0,0 +1,212 @@
+"""
+Fry IoT shared build helpers
+
+Config loading, APT sources and the mmdebstrap/rootfs cache logic used by both
+build-image.py and build-rootfs.py, which read and write the same rootfs cache.
+"""
+
+import os
+import sys
+import subprocess
+import json
+import functools
+import tomllib
+import hashlib
+from pathlib import Path
+from typing import Optional
+
+# Project paths
+PROJECT_ROOT = Path(__file__).parent.parent
+BASE_CONFIG_PATH = PROJECT_ROOT / "base-config.toml"
+PROFILES_DIR = PROJECT_ROOT / "profiles"
+CACHE_DIR = PROJECT_ROOT / "cache"
+
+# Longest single command-line argument accepted by Linux (MAX_ARG_STRLEN), with headroom
+MAX_INCLUDE_ARG_LEN = 128 * 1024 - 1024
+
+# Bump when the mmdebstrap invocation (variant, hooks, options) changes so that
+# rootfs tarballs built the old way are no longer reused
+ROOTFS_CACHE_VERSION = 2
+
+# Number of rootfs tarballs kept in the cache, most recently used first
+ROOTFS_CACHE_KEEP = 4
+
+
+@functools.lru_cache(maxsize=32)
+def _load_toml(path: str, mtime_ns: int) -> dict:
+    """Parse a TOML file; cached until the file's mtime changes."""
+    with open(path, "rb") as f:
+        return tomllib.load(f)
+
+
+def load_toml(path: Path) -> dict:
+    """Load a TOML file, reusing the parsed result if it is unchanged."""
+    return _load_toml(str(path), os.stat(path).st_mtime_ns)
+
+
+def load_config():
+    """Load base configuration."""
+    return load_toml(BASE_CONFIG_PATH)
+
+
+def load_profile_config(profile_name: str):
+    """Load profile-specific configuration."""
+    profile_path = PROFILES_DIR / profile_name / "profile-config.toml"
+    if not profile_path.exists():
+        print(f"Error: Profile '{profile_name}' not found at {profile_path}")
+        sys.exit(1)
+    return load_toml(profile_path)
+
+
+def get_architecture(profile_config: dict) -> str:
+    """Get Debian architecture from profile config."""
+    arch_mapping = {
+        "x86_64": "amd64",
+        "amd64": "amd64",
+        "arm64": "arm64",
+        "aarch64": "arm64",
+        "armhf": "armhf",
+        "arm": "armhf",
+        "mipsel": "mipsel",
+        "mips": "mips",
+    }
+    arch = profile_config.get("build", {}).get("architecture", "amd64")
+    return arch_mapping.get(arch, arch)
+
+
+@functools.lru_cache(maxsize=None)
+def render_sources_list(suite: str, mirror: str, security_mirror: str, components: tuple) -> str:
+    """Render the APT sources.list for a suite, mirror and component set."""
+    components_str = " ".join(components)
+    return f"""# Fry IoT - Debian {suite} sources
+deb {mirror} {suite} {components_str}
+deb {mirror} {suite}-updates {components_str}
+deb {security_mirror} {suite}-security {components_str}
+"""
+
+
+def get_sources_list(base_config: dict) -> str:
+    """Get the APT sources.list content for the base configuration."""
+    debian_config = base_config.get("debian", {})
+    return render_sources_list(
+        debian_config.get("suite", "trixie"),
+        debian_config.get("mirror", "https://deb.debian.org/debian"),
+        debian_config.get("security_mirror", "https://deb.debian.org/debian-security"),
+        tuple(debian_config.get("components", ["main", "contrib", "non-free", "non-free-firmware"])),
+    )
+
+
+def get_include_options(packages: list) -> list:
+    """Split the package list over repeated --include options that each fit in one argument."""
+    options = []
+    chunk = []
+    chunk_len = 0
+    for package in packages:
+        if chunk and chunk_len + len(package) + 1 > MAX_INCLUDE_ARG_LEN:
+            options.append("--include=" + ",".join(chunk))
+            chunk = []
+            chunk_len = 0
+        chunk.append(package)
+        chunk_len += len(package) + 1
+    if chunk:
+        options.append("--include=" + ",".join(chunk))
+    return options
+
+
+def get_parallel_unpack_env() -> list:
+    """Get environment assignments that let xz and dpkg-deb use all CPU cores."""
+    return [
+        "XZ_OPT=-T0",
+        f"DPKG_DEB_THREADS_MAX={os.cpu_count() or 1}",
+    ]
+
+
+def get_apt_proxy_options(apt_proxy: str) -> list:
+    """Get mmdebstrap options that send APT traffic through an HTTP proxy."""
+    # mmdebstrap writes every --aptopt to 99mmdebstrap inside the chroot; drop it
+    # so the build host's proxy does not ship in the image
+    return [
+        f'--aptopt=Acquire::http::Proxy "{apt_proxy}"',
+        '--customize-hook=rm -f "$1"/etc/apt/apt.conf.d/99mmdebstrap',
+    ]
+
+
+def get_proxied_mirror(mirror: str) -> str:
+    """Rewrite an HTTPS mirror to plain HTTP so a caching proxy can serve it."""
+    if mirror.startswith("https://"):
+        return "http://" + mirror[len("https://"):]
+    return mirror
+
+
+def get_apt_cache_options(cache_path: Path) -> list:
+    """Get mmdebstrap options that persist downloaded packages in cache_path."""
+    cache_path.mkdir(parents=True, exist_ok=True)
+    return [
+        "--skip=download/empty",
+        "--skip=essential/unlink",
+        "--setup-hook=mkdir -p \"$1\"/var/cache/apt/archives/",
+        f"--setup-hook=sync-in {cache_path} /var/cache/apt/archives/",
+        f"--customize-hook=sync-out /var/cache/apt/archives {cache_path}",
+        "--customize-hook=rm -f \"$1\"/var/cache/apt/archives/*.deb",
+    ]
+
+
+def get_rootfs_cache_path(arch: str, suite: str, mirror: str, components: list, packages: list,
+                          apt_proxy: Optional[str] = None) -> Path:
+    """Get the rootfs tarball cache path for a set of build inputs."""
+    inputs = {
+        "version": ROOTFS_CACHE_VERSION,
+        "arch": arch,
+        "suite": suite,
+        "mirror": mirror,
+        "components": components,
+        "pkgs": sorted(packages),
+        "aptopts": get_apt_proxy_options(apt_proxy) if apt_proxy else [],
+    }
+    key = hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()[:16]
+    return CACHE_DIR / f"rootfs-{arch}-{key}.tar.zst"
+
+
+def restore_rootfs_cache(cache_path: Path, rootfs_path: Path):
+    """Extract a cached rootfs tarball into rootfs_path."""
+    subprocess.run([
+        "sudo", "tar", "--zstd", "--xattrs", "--xattrs-include=*", "--numeric-owner",
+        "-xpf", str(cache_path), "-C", str(rootfs_path)
+    ], check=True)
+    # Mark the tarball as recently used so eviction keeps it
+    subprocess.run(["sudo", "touch", str(cache_path)], check=True)
+
+
+def save_rootfs_cache(rootfs_path: Path, cache_path: Path):
+    """Store a freshly built rootfs as a tarball for later builds."""
+    partial_path = cache_path.with_name(cache_path.name + ".part")
+    subprocess.run([
+        "sudo", "tar", "--zstd", "--xattrs", "--xattrs-include=*", "--numeric-owner",
+        "-cf", str(partial_path), "-C", str(rootfs_path), "."
+    ], check=True)
+    subprocess.run(["sudo", "mv", str(partial_path), str(cache_path)], check=True)
+    evict_rootfs_caches()
+
+
+def evict_rootfs_caches():
+    """Delete all but the ROOTFS_CACHE_KEEP most recently used rootfs tarballs."""
+    tarballs = sorted(CACHE_DIR.glob("rootfs-*.tar.zst"), key=lambda p: p.stat().st_mtime, reverse=True)
+    stale = tarballs[ROOTFS_CACHE_KEEP:]
+    if stale:
+        print(f"Evicting {len(stale)} old rootfs cache(s)")
+        subprocess.run(["sudo", "rm", "-f", *map(str, stale)], check=True)
+
+
+def discard_rootfs(rootfs_path: Path):
+    """Move the previous rootfs aside and delete it in the background."""
+    old_path = rootfs_path.with_name(f"{rootfs_path.name}.old.{os.getpid()}")
+    subprocess.run(["sudo", "mv", str(rootfs_path), str(old_path)], check=True)
+
+    # Also remove trees left behind by interrupted builds
+    old_paths = [str(p) for p in rootfs_path.parent.glob(f"{rootfs_path.name}.old.*")]
+    subprocess.Popen(
+        ["sudo", "rm", "-rf", *old_paths],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
@@ -7,17 +7,13 @@ Uploads built Fry IoT images to cloud storage (Azure Blob Storage or S3-compatib
 
 import os
 import sys
+import tomllib
 import json
 import hashlib
 from pathlib import Path
-from datetime import datetime
-
-import toml
-from azure.storage.blob import BlobServiceClient
-from dotenv import load_dotenv
-from tqdm import tqdm
-
-load_dotenv()
+from typing import Optional
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
 
 # Project paths
 PROJECT_ROOT = Path(__file__).parent.parent
@@ -25,9 +21,8 @@ BASE_CONFIG_PATH = PROJECT_ROOT / "base-config.toml"
 OUTPUT_DIR = PROJECT_ROOT / "output"
 TMP_DIR = PROJECT_ROOT / "tmp"
 
-# Azure configuration
-AZURE_CONNECTION_STRING = os.getenv("AZURE_CONNECTION_STRING")
-CONTAINER_NAME = os.getenv("CONTAINER_NAME", "fry-iot-images")
+# Artifact suffixes picked up for upload
+IMAGE_SUFFIXES = (".img", ".img.zst", ".img.xz", ".img.gz", ".tar.gz", ".tar.xz")
 
 # Image name template
 IMAGE_NAME_TEMPLATE = "fry-iot-{codename}-{version}"
@@ -35,8 +30,8 @@ IMAGE_NAME_TEMPLATE = "fry-iot-{codename}-{version}"
 
 def load_config():
     """Load base configuration."""
-    with open(BASE_CONFIG_PATH) as f:
-        return toml.load(f)
+    with open(BASE_CONFIG_PATH, "rb") as f:
+        return tomllib.load(f)
 
 
 def load_device_info():
@@ -50,37 +45,45 @@ def load_device_info():
         return json.load(f)
 
 
+def load_build_date() -> str:
+    """Load the build date recorded by configure, or the current time if unavailable."""
+    build_config_path = TMP_DIR / "build-config.json"
+    try:
+        with open(build_config_path) as f:
+            build_date = json.load(f).get("os", {}).get("build_date")
+    except (OSError, json.JSONDecodeError):
+        build_date = None
+    return build_date or datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
 def calculate_sha256(file_path: Path) -> str:
     """Calculate SHA256 hash of a file."""
-    sha256_hash = hashlib.sha256()
     with open(file_path, "rb") as f:
-        for byte_block in iter(lambda: f.read(4096), b""):
-            sha256_hash.update(byte_block)
-    return sha256_hash.hexdigest()
+        # Hint sequential access so the kernel reads ahead aggressively
+        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        return hashlib.file_digest(f, "sha256").hexdigest()
 
 
 def find_images() -> list:
-    """Find all built images in the output directory."""
+    """Find all built images in the output directory as (path, size, mtime_ns) tuples."""
     images = []
 
     if not OUTPUT_DIR.exists():
         return images
 
-    # Look for .img and compressed variants
-    for pattern in ["*.img", "*.img.xz", "*.img.gz", "*.tar.gz", "*.tar.xz"]:
-        images.extend(OUTPUT_DIR.glob(pattern))
+    # Look for .img and compressed variants; scandir entries cache their stat result
+    with os.scandir(OUTPUT_DIR) as entries:
+        for entry in entries:
+            if entry.name.endswith(IMAGE_SUFFIXES) and not entry.name.startswith(".") and entry.is_file():
+                stat = entry.stat()
+                images.append((Path(entry.path), stat.st_size, stat.st_mtime_ns))
 
     return sorted(images)
 
 
 def check_blob_exists(blob_service_client, container_name: str, blob_path: str) -> bool:
     """Check if a blob already exists."""
-    try:
-        container_client = blob_service_client.get_container_client(container_name)
-        blobs = list(container_client.list_blobs(name_starts_with=blob_path))
-        return len(blobs) > 0
-    except Exception:
-        return False
+    return blob_service_client.get_blob_client(container=container_name, blob=blob_path).exists()
 
 
 def upload_file_to_azure(
@@ -89,8 +92,11 @@ def upload_file_to_azure(
     container_name: str,
     blob_path: str,
     overwrite: bool = False,
+    file_size: Optional[int] = None,
 ):
     """Upload a file to Azure Blob Storage with progress bar."""
+    from tqdm import tqdm
+
     if not overwrite and check_blob_exists(blob_service_client, container_name, blob_path):
         print(f"  Blob already exists: {blob_path}")
         response = input("  Overwrite? (yes/no): ").strip().lower()
@@ -102,7 +108,8 @@ def upload_file_to_azure(
         container=container_name, blob=blob_path
     )
 
-    file_size = file_path.stat().st_size
+    if file_size is None:
+        file_size = file_path.stat().st_size
     print(f"  Uploading: {file_path.name} ({file_size / (1024*1024):.1f} MB)")
 
     with open(file_path, "rb") as data:
@@ -112,14 +119,14 @@ def upload_file_to_azure(
                 overwrite=True,
                 max_concurrency=4,
                 length=file_size,
+                progress_hook=lambda current, total: pbar.update(current - pbar.n),
             )
-            pbar.update(file_size)
 
     print(f"  Uploaded to: {blob_path}")
     return True
 
 
-def create_manifest(images: list, device_info: dict, base_config: dict) -> dict:
+def create_manifest(images: list, device_info: dict, base_config: dict, build_date: str) -> dict:
     """Create a manifest file for the build."""
     version = base_config.get("general", {}).get("os_version", "1.0.0")
     codename = device_info.get("name", "unknown")
@@ -129,16 +136,21 @@ def create_manifest(images: list, device_info: dict, base_config: dict) -> dict:
         "version": version,
         "codename": codename,
         "architecture": device_info.get("architecture", "unknown"),
-        "build_date": datetime.utcnow().isoformat() + "Z",
+        "build_date": build_date,
         "debian_suite": base_config.get("debian", {}).get("suite", "trixie"),
         "images": [],
     }
 
-    for image_path in images:
+    # hashlib releases the GIL while hashing, so images hash in parallel on separate cores
+    with ThreadPoolExecutor(max_workers=min(len(images), os.cpu_count() or 1)) as executor:
+        hashes = list(executor.map(calculate_sha256, [image_path for image_path, _, _ in images]))
+
+    for (image_path, size, mtime_ns), sha256 in zip(images, hashes):
         image_info = {
             "filename": image_path.name,
-            "size": image_path.stat().st_size,
-            "sha256": calculate_sha256(image_path),
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "sha256": sha256,
         }
         manifest["images"].append(image_info)
 
@@ -153,8 +165,16 @@ def main():
 ╚══════════════════════════════════════════════════════════════╝
 """)
 
+    # The Azure SDK and dotenv are only needed here, so the other tools never load them
+    from azure.storage.blob import BlobServiceClient
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    connection_string = os.getenv("AZURE_CONNECTION_STRING")
+    container_name = os.getenv("CONTAINER_NAME", "fry-iot-images")
+
     # Check Azure configuration
-    if not AZURE_CONNECTION_STRING:
+    if not connection_string:
         print("Error: AZURE_CONNECTION_STRING environment variable not set.")
         print("Please set it in your .env file or environment.")
         sys.exit(1)
@@ -179,12 +199,13 @@ def main():
         sys.exit(1)
 
     print(f"Found {len(images)} image(s):")
-    for img in images:
-        print(f"  - {img.name} ({img.stat().st_size / (1024*1024):.1f} MB)")
+    for img, size, _ in images:
+        print(f"  - {img.name} ({size / (1024*1024):.1f} MB)")
     print()
 
-    # Create manifest
-    manifest = create_manifest(images, device_info, base_config)
+    # Create manifest, reusing configure's timestamp so it matches build-config.json
+    build_date = load_build_date()
+    manifest = create_manifest(images, device_info, base_config, build_date)
     manifest_path = OUTPUT_DIR / "manifest.json"
     with open(manifest_path, "w") as f:
         json.dump(manifest, f, indent=2)
@@ -201,8 +222,11 @@ def main():
     # Connect to Azure
     print("Connecting to Azure Blob Storage...")
     try:
+        # Large artifacts are uploaded as blocks staged in parallel (max_concurrency)
         blob_service_client = BlobServiceClient.from_connection_string(
-            AZURE_CONNECTION_STRING
+            connection_string,
+            max_single_put_size=64 * 1024 * 1024,
+            max_block_size=8 * 1024 * 1024,
         )
     except Exception as e:
         print(f"Error connecting to Azure: {e}")
@@ -210,30 +234,30 @@ def main():
 
     # Upload files
     blob_prefix = f"releases/{codename}/{version}"
-    print(f"Uploading to: {CONTAINER_NAME}/{blob_prefix}/")
+    print(f"Uploading to: {container_name}/{blob_prefix}/")
     print()
 
     uploaded_count = 0
 
     # Upload images
-    for image_path in images:
+    for image_path, size, _ in images:
         blob_path = f"{blob_prefix}/{image_path.name}"
         if upload_file_to_azure(
-            image_path, blob_service_client, CONTAINER_NAME, blob_path
+            image_path, blob_service_client, container_name, blob_path, file_size=size
         ):
             uploaded_count += 1
 
     # Upload manifest
     manifest_blob_path = f"{blob_prefix}/manifest.json"
     upload_file_to_azure(
-        manifest_path, blob_service_client, CONTAINER_NAME, manifest_blob_path, overwrite=True
+        manifest_path, blob_service_client, container_name, manifest_blob_path, overwrite=True
     )
     uploaded_count += 1
 
     # Upload checksums
     sha256sums_blob_path = f"{blob_prefix}/SHA256SUMS"
     upload_file_to_azure(
-        sha256sums_path, blob_service_client, CONTAINER_NAME, sha256sums_blob_path, overwrite=True
+        sha256sums_path, blob_service_client, container_name, sha256sums_blob_path, overwrite=True
     )
     uploaded_count += 1
 
@@ -244,10 +268,10 @@ def main():
 ╚══════════════════════════════════════════════════════════════╝
 
 Uploaded {uploaded_count} file(s) to Azure Blob Storage.
-Location: {CONTAINER_NAME}/{blob_prefix}/
+Location: {container_name}/{blob_prefix}/
 
 Download URL (if public):
-  https://<storage-account>.blob.core.windows.net/{CONTAINER_NAME}/{blob_prefix}/
+  https://<storage-account>.blob.core.windows.net/{container_name}/{blob_prefix}/
 """)
 
 